@@ -1,14 +1,17 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+import asyncio
+import json
 import logging
-from typing import Dict
+from typing import Dict, List, Optional
 
 from app.services.letmein_game import LetMeInGame
-from app.services.llm_api import initialize_ollama, test_connection
+from app.services.llm_api import initialize_ollama, test_connection, get_load_status, get_batch_parallel_limit
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -47,11 +50,26 @@ game = LetMeInGame()
 # Session storage (in production, use Redis or database)
 game_sessions: Dict[str, Dict] = {}
 
+# Batch message limits (parallelism is capped by get_batch_parallel_limit)
+BATCH_MAX_ITEMS = 50
+
+# Slots shared by all running batches, created on first use
+batch_slots: Optional[asyncio.Semaphore] = None
+
 class GameMessage(BaseModel):
     session_id: str
     level: int
     message: str
 
+class BatchItem(BaseModel):
+    level: int = Field(ge=1, le=game.max_level)
+    message: str
+
+class BatchMessages(BaseModel):
+    session_id: str
+    items: List[BatchItem] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    max_parallel: Optional[int] = Field(None, ge=1)
+
 class PasswordSubmission(BaseModel):
     session_id: str
     level: int
@@ -60,6 +78,7 @@ class PasswordSubmission(BaseModel):
 class GameResponse(BaseModel):
     success: bool
     ai_response: str
+    model_tier: str = ""
 
 class PasswordResponse(BaseModel):
     success: bool
@@ -85,23 +104,33 @@ async def read_root(request: Request):
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    ollama_connected = test_connection()
+    ollama_connected, missing_models = await run_in_threadpool(test_connection)
     return JSONResponse({
         "status": "healthy",
         "ollama_connected": ollama_connected,
-        "game_ready": ollama_connected
+        "game_ready": ollama_connected and not missing_models,
+        "missing_models": missing_models,
+        "model_tier": get_load_status().get("active_tier", "")
     })
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Load and model tier metrics"""
+    return JSONResponse(get_load_status())
+
 @app.get("/api/game/welcome/{level}")
 async def get_welcome_message(level: int):
     """Get welcome message for a specific level"""
     try:
         # Get welcome message from AI for this level
-        welcome_response = game.get_letmein_response(level, "Hello! I just started this level.")
+        welcome_response, model_tier = await game.get_letmein_response_with_tier(
+            level, "Hello! I just started this level."
+        )
         return JSONResponse({
             "success": True,
             "level": level,
-            "welcome_message": welcome_response
+            "welcome_message": welcome_response,
+            "model_tier": model_tier
         })
     except Exception as e:
         logger.error(f"Error getting welcome message for level {level}: {e}")
@@ -121,18 +150,85 @@ async def handle_game_message(message: GameMessage):
                 "completed_levels": set()
             }
         
-        # Get AI response
-        ai_response = game.get_letmein_response(message.level, message.message)
+        # Get AI response (failures are shown to the player as the reply)
+        try:
+            ai_response, model_tier = await game.get_letmein_response_with_tier(
+                message.level, message.message
+            )
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            ai_response, model_tier = f"Error: {str(e)}", ""
         
         return GameResponse(
             success=True,
-            ai_response=ai_response
+            ai_response=ai_response,
+            model_tier=model_tier
         )
         
     except Exception as e:
         logger.error(f"Error handling game message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/game/messages:batch")
+async def handle_game_messages_batch(batch: BatchMessages):
+    """Handle many game messages and stream AI responses as NDJSON in completion order"""
+    global batch_slots
+    
+    limit = get_batch_parallel_limit()
+    if batch.max_parallel is not None and batch.max_parallel > limit:
+        raise HTTPException(status_code=422, detail=f"max_parallel must be at most {limit}")
+    
+    # Initialize session if not exists
+    if batch.session_id not in game_sessions:
+        game_sessions[batch.session_id] = {
+            "completed_levels": set()
+        }
+    
+    # Generation still goes through the Ollama concurrency limit; batch_slots
+    # keeps all batches together to at most half of its slots so interactive
+    # players are not locked out, and max_parallel limits this batch within that
+    if batch_slots is None:
+        batch_slots = asyncio.Semaphore(limit)
+    semaphore = asyncio.Semaphore(batch.max_parallel or limit)
+    
+    async def run_item(index: int, item: BatchItem) -> dict:
+        async with semaphore, batch_slots:
+            try:
+                ai_response, model_tier = await game.get_letmein_response_with_tier(
+                    item.level, item.message
+                )
+                return {
+                    "index": index,
+                    "level": item.level,
+                    "success": True,
+                    "ai_response": ai_response,
+                    "model_tier": model_tier,
+                    "error": None
+                }
+            except Exception as e:
+                logger.error(f"Error handling batch item {index}: {e}")
+                return {
+                    "index": index,
+                    "level": item.level,
+                    "success": False,
+                    "ai_response": "",
+                    "model_tier": "",
+                    "error": str(e)
+                }
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(batch.items)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                yield json.dumps(result) + "\n"
+        finally:
+            # Client went away - drop items that have not started yet
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @app.post("/api/game/password", response_model=PasswordResponse)
 async def check_password(password_submission: PasswordSubmission):
     """Check if submitted password is correct"""
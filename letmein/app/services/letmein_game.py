@@ -1,8 +1,9 @@
-from app.services.llm_api import generate_text
+from app.services.llm_api import generate_text, generate_text_with_tier
 from app.services.system_prompts import SystemPrompts
 import json
 import logging
 import random
+from typing import Tuple
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -88,7 +89,7 @@ class LetMeInGame:
         correct_password = self.passwords[level_key]
         return correct_password.lower() in user_input.lower()
     
-    def get_letmein_response(self, level: int, user_message: str) -> str:
+    async def get_letmein_response(self, level: int, user_message: str) -> str:
         """
         Get AI response for Let Me In game at the given level
         
@@ -99,35 +100,49 @@ class LetMeInGame:
         Returns:
             AI response string
         """
+        try:
+            response, _ = await self.get_letmein_response_with_tier(level, user_message)
+            return response
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            logger.error(f"Error generating LLM response: {e}")
+            return f"Error: Failed to generate response - {str(e)}"
+    
+    async def get_letmein_response_with_tier(self, level: int, user_message: str) -> Tuple[str, str]:
+        """
+        Get AI response for Let Me In game along with the model tier that served it
+        
+        Args:
+            level: Game level (1-4)
+            user_message: User's message to the AI
+            
+        Returns:
+            Tuple of (AI response string, tier name)
+            
+        Raises:
+            ValueError: If the level has no prompt or password
+            RuntimeError, requests.exceptions.RequestException: If generation fails
+        """
         level_key = f"lv{level}"
         
         # Get system prompt for this level
         base_prompt = SystemPrompts.letmein_game.get(level_key)
         if not base_prompt:
-            return f"Error: Invalid game level '{level_key}'. No matching prompt found."
+            raise ValueError(f"Invalid game level '{level_key}'. No matching prompt found.")
         
         if level_key not in self.passwords:
-            return f"Error: Password for level {level} not found."
+            raise ValueError(f"Password for level {level} not found.")
         
         # Inject the password into the system prompt
         password = self.passwords[level_key]
         system_prompt = base_prompt.replace(f"[LETMEIN_LV{level}_PASS]", password)
         
         # Generate response using LLM
-        try:
-            response = generate_text(
-                user_message,
-                is_initial=False,
-                prompt_type="letmein_game",
-                system_prompt=system_prompt
-            )
-            return response
-        except Exception as e:
-            logger.error(f"Error generating LLM response: {e}")
-            return f"Error: Failed to generate response - {str(e)}"
+        return await generate_text_with_tier(user_message, system_prompt=system_prompt)
 
 # Legacy function for backward compatibility
-def get_letmein_prompts(level: int, user_message: str, passwords: dict) -> str:
+async def get_letmein_prompts(level: int, user_message: str, passwords: dict) -> str:
     """
     Generates the AI response for Let Me In game at the given level (lv1+),
     injecting the dynamic password into the system prompt.
@@ -144,7 +159,7 @@ def get_letmein_prompts(level: int, user_message: str, passwords: dict) -> str:
     password = passwords[key]
     prompt = base_prompt.replace(f"[LETMEIN_LV{level}_PASS]", password)
 
-    response = generate_text(
+    response = await generate_text(
         user_message,
         is_initial=False,
         prompt_type="letmein_game",
@@ -1,22 +1,193 @@
 import requests
+import asyncio
 import json
 import logging
-from typing import Optional
+import math
+import time
+from collections import deque
+from typing import List, Optional, Tuple
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL_NAME = "gemma3:270m"
+DEFAULT_NUM_PREDICT = 500
+
+
+class LoadMonitor:
+    def __init__(self, tiers: List[dict], max_concurrent_requests: int = 4,
+                 latency_window_seconds: float = 60.0, min_tier_seconds: float = 15.0):
+        """
+        Track Ollama load and pick the model tier to serve requests with
+        
+        Tier 0 is the normal tier. Each later tier is entered when the queue
+        depth or p95 latency reaches its enter_* thresholds, and left again
+        only once both drop to its exit_* thresholds, so the tier does not
+        flap around a single boundary. Missing exit_* thresholds default to
+        half of the matching enter_* threshold.
+        
+        Requests queue for a slot on the event loop, so waiting players do
+        not tie up worker threads; only the Ollama call itself runs in one.
+        
+        Args:
+            tiers: Ordered tier definitions (name, model, num_predict, thresholds)
+            max_concurrent_requests: Generations allowed to run against Ollama at once
+            latency_window_seconds: How far back latency samples count towards p95
+            min_tier_seconds: Minimum time to stay in a tier before switching again
+        """
+        self.tiers = tiers
+        for tier in self.tiers[1:]:
+            tier.setdefault("exit_queue_depth", tier.get("enter_queue_depth", math.inf) / 2)
+            tier.setdefault("exit_p95_latency", tier.get("enter_p95_latency", math.inf) / 2)
+        self.max_concurrent_requests = max_concurrent_requests
+        self.latency_window_seconds = latency_window_seconds
+        self.min_tier_seconds = min_tier_seconds
+        
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_requests)
+        self._latencies = deque()
+        self._waiting = 0
+        self._in_flight = 0
+        self._tier_index = 0
+        self._tier_since = time.monotonic()
+        self._tier_switches = 0
+        self._errors = 0
+        self._requests_per_tier = {tier["name"]: 0 for tier in tiers}
+    
+    async def acquire(self) -> dict:
+        """
+        Wait for a generation slot and return the tier to generate with
+        
+        Every successful acquire must be paired with release().
+        
+        Returns:
+            Tier definition for this request
+        """
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        
+        self._in_flight += 1
+        self._reevaluate()
+        tier = self.tiers[self._tier_index]
+        self._requests_per_tier[tier["name"]] += 1
+        return tier
+    
+    def release(self, latency: float, success: bool = True):
+        """
+        Free a generation slot and record how long the generation took
+        
+        Failed generations are counted as errors rather than latency samples,
+        so fast failures do not pull p95 down while Ollama is struggling.
+        
+        Args:
+            latency: Generation time in seconds
+            success: Whether the generation succeeded
+        """
+        self._in_flight -= 1
+        if success:
+            self._latencies.append((time.monotonic(), latency))
+        else:
+            self._errors += 1
+        self._reevaluate()
+        self._slots.release()
+    
+    def _p95_latency(self, now: float) -> float:
+        """Return the p95 latency over the window"""
+        while self._latencies and now - self._latencies[0][0] > self.latency_window_seconds:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        samples = sorted(latency for _, latency in self._latencies)
+        return samples[max(0, math.ceil(0.95 * len(samples)) - 1)]
+    
+    def _reevaluate(self):
+        """Move between tiers based on current load"""
+        now = time.monotonic()
+        if now - self._tier_since < self.min_tier_seconds:
+            return
+        
+        depth = self._waiting
+        p95 = self._p95_latency(now)
+        index = self._tier_index
+        
+        if index + 1 < len(self.tiers):
+            upper = self.tiers[index + 1]
+            if (depth >= upper.get("enter_queue_depth", math.inf)
+                    or p95 >= upper.get("enter_p95_latency", math.inf)):
+                index += 1
+        
+        if index == self._tier_index and index > 0:
+            current = self.tiers[index]
+            if (depth <= current["exit_queue_depth"]
+                    and p95 <= current["exit_p95_latency"]):
+                index -= 1
+        
+        if index != self._tier_index:
+            logger.info(
+                f"Switching model tier {self.tiers[self._tier_index]['name']} -> "
+                f"{self.tiers[index]['name']} (queue depth {depth}, p95 {p95:.2f}s)"
+            )
+            self._tier_index = index
+            self._tier_since = now
+            self._tier_switches += 1
+    
+    def status(self) -> dict:
+        """
+        Snapshot of load and tier state for health/metrics reporting
+        
+        Returns:
+            Dictionary of load metrics
+        """
+        tier = self.tiers[self._tier_index]
+        return {
+            "active_tier": tier["name"],
+            "model": tier["model"],
+            "num_predict": tier["num_predict"],
+            "queue_depth": self._waiting,
+            "in_flight": self._in_flight,
+            "max_concurrent_requests": self.max_concurrent_requests,
+            "p95_latency": round(self._p95_latency(time.monotonic()), 3),
+            "latency_samples": len(self._latencies),
+            "tier_switches": self._tier_switches,
+            "errors": self._errors,
+            "requests_per_tier": dict(self._requests_per_tier)
+        }
+
+    @property
+    def batch_parallel_limit(self) -> int:
+        """Items a single batch may run at once, leaving slots for interactive players"""
+        return max(1, self.max_concurrent_requests // 2)
+
+
 class OllamaAPI:
-    def __init__(self, base_url: str = "http://host.docker.internal:11434"):
+    def __init__(self, base_url: str = "http://host.docker.internal:11434",
+                 model_name: str = DEFAULT_MODEL_NAME, load_settings: Optional[dict] = None):
         """
         Initialize Ollama API client
         
         Args:
             base_url: Ollama server URL (using Docker internal networking to host)
+            model_name: Model used when no load tiers are configured
+            load_settings: Optional "load_shedding" section from config.json
         """
         self.base_url = base_url
-        self.model_name = "gemma3:270m"
+        self.model_name = model_name
+        
+        load_settings = load_settings or {}
+        tiers = [dict(tier) for tier in load_settings.get("tiers") or [{"name": "normal"}]]
+        for tier in tiers:
+            tier.setdefault("model", model_name)
+            tier.setdefault("num_predict", DEFAULT_NUM_PREDICT)
+        
+        self.load_monitor = LoadMonitor(
+            tiers,
+            max_concurrent_requests=load_settings.get("max_concurrent_requests", 4),
+            latency_window_seconds=load_settings.get("latency_window_seconds", 60.0),
+            min_tier_seconds=load_settings.get("min_tier_seconds", 15.0)
+        )
         
     def _make_request(self, endpoint: str, data: dict) -> dict:
         """
@@ -38,7 +209,37 @@ class OllamaAPI:
             logger.error(f"Error making request to Ollama: {e}")
             raise
     
-    def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    def list_models(self) -> List[str]:
+        """
+        List models pulled on the Ollama server without running a generation
+        
+        Returns:
+            Model names, with untagged names normalised to ":latest"
+        """
+        url = f"{self.base_url}/api/tags"
+        try:
+            response = requests.get(url, timeout=5)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error reaching Ollama: {e}")
+            raise
+        
+        names = [model.get("name", "") for model in response.json().get("models", [])]
+        return [name if ":" in name else f"{name}:latest" for name in names]
+    
+    def missing_models(self) -> List[str]:
+        """
+        Find tier models that have not been pulled on the Ollama server
+        
+        Returns:
+            Sorted list of missing model names (empty when every tier can run)
+        """
+        available = set(self.list_models())
+        required = {tier["model"] if ":" in tier["model"] else f"{tier['model']}:latest"
+                    for tier in self.load_monitor.tiers}
+        return sorted(required - available)
+    
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
         """
         Generate text using Ollama
         
@@ -49,14 +250,38 @@ class OllamaAPI:
         Returns:
             Generated response text
         """
+        try:
+            response, _ = await self.generate_with_tier(prompt, system_prompt)
+            return response
+        except Exception as e:
+            return f"Error: Failed to generate response - {str(e)}"
+    
+    async def generate_with_tier(self, prompt: str, system_prompt: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Generate text using Ollama and report the model tier that served it
+        
+        Args:
+            prompt: User input prompt
+            system_prompt: System/context prompt
+            
+        Returns:
+            Tuple of (generated response text, tier name)
+            
+        Raises:
+            requests.exceptions.RequestException: If the Ollama call fails
+        """
+        tier = await self.load_monitor.acquire()
+        started = time.monotonic()
+        success = False
+        
         data = {
-            "model": self.model_name,
+            "model": tier["model"],
             "prompt": prompt,
             "stream": False,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
-                "max_tokens": 500
+                "num_predict": tier["num_predict"]
             }
         }
         
@@ -64,11 +289,15 @@ class OllamaAPI:
             data["system"] = system_prompt
             
         try:
-            response = self._make_request("api/generate", data)
-            return response.get("response", "")
+            # Only the blocking HTTP call runs in a worker thread
+            response = await asyncio.to_thread(self._make_request, "api/generate", data)
+            success = True
+            return response.get("response", ""), tier["name"]
         except Exception as e:
             logger.error(f"Error generating text: {e}")
-            return f"Error: Failed to generate response - {str(e)}"
+            raise
+        finally:
+            self.load_monitor.release(time.monotonic() - started, success)
     
 
 
@@ -92,7 +321,8 @@ def initialize_ollama(config_path: str = "app/config.json") -> bool:
             config = json.load(f)
         
         ollama_url = config.get("ollama_endpoint", "http://host.docker.internal:11434")
-        ollama_api = OllamaAPI(ollama_url)
+        model_name = config.get("model_name", DEFAULT_MODEL_NAME)
+        ollama_api = OllamaAPI(ollama_url, model_name, config.get("load_shedding"))
         
         logger.info("Ollama API initialized successfully")
         return True
@@ -101,8 +331,8 @@ def initialize_ollama(config_path: str = "app/config.json") -> bool:
         logger.error(f"Failed to initialize Ollama API: {e}")
         return False
 
-def generate_text(user_message: str, is_initial: bool = False, 
-                 prompt_type: str = "general", system_prompt: str = None) -> str:
+async def generate_text(user_message: str, is_initial: bool = False, 
+                       prompt_type: str = "general", system_prompt: str = None) -> str:
     """
     Generate text response using Ollama
     
@@ -115,36 +345,84 @@ def generate_text(user_message: str, is_initial: bool = False,
     Returns:
         Generated response text
     """
-    global ollama_api
-    
-    if ollama_api is None:
-        if not initialize_ollama():
-            return "Error: Ollama API not initialized"
-    
     try:
-        response = ollama_api.generate(user_message, system_prompt)
+        response, _ = await generate_text_with_tier(user_message, system_prompt)
         return response
     except Exception as e:
         logger.error(f"Error in generate_text: {e}")
         return f"Error generating response: {str(e)}"
 
-def test_connection() -> bool:
+async def generate_text_with_tier(user_message: str, system_prompt: str = None) -> Tuple[str, str]:
+    """
+    Generate text response using Ollama and report the model tier that served it
+    
+    Args:
+        user_message: User input message
+        system_prompt: System prompt to use
+        
+    Returns:
+        Tuple of (generated response text, tier name)
+        
+    Raises:
+        RuntimeError: If the Ollama API cannot be initialized
+        requests.exceptions.RequestException: If the Ollama call fails
+    """
+    global ollama_api
+    
+    if ollama_api is None:
+        if not initialize_ollama():
+            raise RuntimeError("Ollama API not initialized")
+    
+    return await ollama_api.generate_with_tier(user_message, system_prompt)
+
+def test_connection() -> Tuple[bool, List[str]]:
     """
-    Test connection to Ollama server
+    Test connection to Ollama server and check every tier's model is pulled
+    
+    Uses the model listing rather than a generation, so health probes stay
+    out of the load monitor.
     
     Returns:
-        True if connection successful, False otherwise
+        Tuple of (connection successful, missing tier model names)
     """
     global ollama_api
     
     if ollama_api is None:
         if not initialize_ollama():
-            return False
+            return False, []
     
     try:
-        # Simple test by trying to generate with the model
-        test_response = ollama_api.generate("test", "You are a helpful assistant.")
-        return bool(test_response and not test_response.startswith("Error:"))
+        return True, ollama_api.missing_models()
     except Exception as e:
         logger.error(f"Connection test failed: {e}")
-        return False
+        return False, []
+
+def get_load_status() -> dict:
+    """
+    Get current load and model tier metrics
+    
+    Returns:
+        Dictionary of load metrics, or an error entry if not initialized
+    """
+    global ollama_api
+    
+    if ollama_api is None:
+        if not initialize_ollama():
+            return {"error": "Ollama API not initialized"}
+    
+    return ollama_api.load_monitor.status()
+
+def get_batch_parallel_limit() -> int:
+    """
+    Get how many items of one batch may run at once
+    
+    Returns:
+        Batch parallelism limit (at least 1)
+    """
+    global ollama_api
+    
+    if ollama_api is None:
+        if not initialize_ollama():
+            return 1
+    
+    return ollama_api.load_monitor.batch_parallel_limit